@@ -13,12 +13,136 @@ References:
 """
 #All of these "errors" occur because pylint does not play well with GObject
 #pylint: disable=E0611, W0613, E1101
-from gi.repository import GObject, Gedit, Gdk
+import collections
+import hashlib
+import json
+import os.path
+import re
+import sys
+import weakref
+
+from gi.repository import GObject, Gedit, Gdk, Gio, GLib
 
 #Change this value to True to enable debug messages to be printed to the
 #the console. Likewise, set it to False to turn of debug messages
 ENABLE_DEBUG = True
 
+#The number of milliseconds to wait after a save before running pylint. If
+#the document is saved again within this window only one run is made.
+LINT_DELAY = 300
+
+#These are the default colors used for the different pylint message
+#types. They are only built once, when the plugin is loaded.
+LINT_COLOR = {
+    'F': Gdk.RGBA(1.0, 0.0, 0.0, 0.25),
+    'E': Gdk.RGBA(1.0, 0.5, 0.5, 0.25),
+    'W': Gdk.RGBA(1.0, 1.0, 0.5, 0.25),
+    'R': Gdk.RGBA(0.5, 1.0, 0.5, 0.25),
+    'C': Gdk.RGBA(0.5, 0.5, 1.0, 0.25),
+
+    #This is a catch all for any code *other* than the one listed.
+    #It is mostly used to signal an error condition inside the
+    #plugin. No one should ever see this color.
+    'O': Gdk.RGBA(0, 0, 0, 0.5),
+}
+
+#The number of pylint results remembered for each document. Saving a document
+#whose contents match a remembered result reuses it instead of running pylint.
+RESULT_CACHE_SIZE = 64
+
+#Pango does not seem to understand that "words" in code don't
+#necessarily end with a period or whitespace. Instead they can
+#contain underscore's or hyphens, etc. This pattern matches a whole word
+#like_this_one or strings-like-this.
+WORD_PATTERN = re.compile(r'[\w\-]+')
+
+#Every managed document has this tag, it marks the documents that have
+#already been examined.
+MANAGED_TAG = 'pylint-O'
+
+#The ManagedDocument of every managed document, keyed by the document's
+#MANAGED_TAG tag. This lets a window find a document whose tab was moved
+#over from another window.
+MANAGED_DOCUMENTS = weakref.WeakValueDictionary()
+
+#Documents that have not been saved yet are linted under this file name,
+#from the user's home directory.
+UNSAVED_FILENAME = 'unsaved.py'
+
+#The number of seconds pylint may spend on a single request. A pylint daemon
+#that takes longer is assumed to be stuck, it is killed and restarted.
+LINT_TIMEOUT = 60
+
+#The pylint daemon is run by the python interpreter named on the first line
+#of this script, so pylint installed with pipx or in a virtualenv is found.
+#If the script is not on the path, PYLINT_PYTHON is used and must be able to
+#import pylint.
+PYLINT_SCRIPT = 'pylint'
+PYLINT_PYTHON = 'python3'
+
+#This script is run in a long lived child process. It imports pylint once and
+#then lints files as they are requested, so pylint's startup cost is only paid
+#once per Gedit session. Each request is a single line of JSON read from stdin
+#and each response is a single line of JSON written to stdout. A request may
+#carry the source to lint, which pylint's --from-stdin option reads. The
+#script writes a "ready" line once pylint has been imported.
+DAEMON_SCRIPT = r"""
+import contextlib, io, json, os, sys, time
+
+from astroid import MANAGER
+from pylint.lint import Run
+
+#Pylint's reporters write to stdout, it is captured for each request below.
+#Pylint reads stdin itself for --from-stdin, it is replaced for each request.
+requests, responses = sys.stdin, sys.stdout
+responses.write('ready\n')
+responses.flush()
+
+#The time each module in astroid's cache was parsed, by module name. A module
+#first seen after a run is taken to be parsed when that run started.
+cached_at = {}
+
+for request in requests:
+    request = json.loads(request)
+    started = time.time()
+
+    #astroid caches parsed modules, forget the ones whose file has changed
+    #since they were parsed. Modules without a file never change.
+    for name, module in list(MANAGER.astroid_cache.items()):
+        path = getattr(module, 'file', None)
+        if not path:
+            continue
+        try:
+            stale = os.path.getmtime(path) >= cached_at.get(name, started)
+        except OSError:
+            stale = True
+        if stale:
+            del MANAGER.astroid_cache[name]
+            cached_at.pop(name, None)
+
+    output = io.StringIO()
+    sys.stdin = io.TextIOWrapper(
+        io.BytesIO(request.get('source', '').encode()), encoding='utf-8')
+    try:
+        #The file's directory may have been removed since it was opened
+        os.chdir(request['cwd'])
+        with contextlib.redirect_stdout(output):
+            run = Run(request['args'], exit=False)
+        status = run.linter.msg_status
+    except (Exception, SystemExit) as err:
+        output.write(repr(err))
+        status = 32
+    finally:
+        sys.stdin = requests
+
+    for name in MANAGER.astroid_cache:
+        cached_at.setdefault(name, started)
+
+    responses.write(json.dumps({'status': status,
+                                'output': output.getvalue()}) + '\n')
+    responses.flush()
+"""
+
 
 class GeditPylint(GObject.Object, Gedit.WindowActivatable):
     """This object represents the "plugin" itself. Basically, Gedit will
@@ -35,10 +159,8 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
         #object is decommissioned.
         self.handlers = list()
 
-        #Gedit often emits several identical adding, loading,
-        #and saving signals. This keeps us from connecting
-        #signals to documents we have already examined.
-        self.known_documents = dict()
+        #A single pylint process is shared by all the documents in the window
+        self.pylint_daemon = PylintDaemon()
 
     def do_activate(self):
         """This is called by Gedit when a view is activated. Generally, this
@@ -55,6 +177,10 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
         #looking for python files.
         self.attach_signal(self.window, 'tab-added', self.tab_added)
 
+        #Start pylint now, so it is warmed up by the time the first lint
+        #is requested
+        self.pylint_daemon.start()
+
     def do_deactivate(self):
         """This is called by Gedit when the plugin is being decommissioned.
         This method's job is to gracefully disconnect all the signal handlers
@@ -67,6 +193,8 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
             debug('Deactivating handler: ', hid)
             self.window.disconnect(hid)
 
+        self.pylint_daemon.stop()
+
     def do_update_state(self):
         """This is called, by Gedit, whenever the Window state is updated.
         This method does not do much. It essentially handles a side case
@@ -90,11 +218,13 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
         mime-type containes 'python' then we setup for running lint when the
         document is saved. Other mime-types are discarded.
 
-        Python documents are only examined once. The known_documents attribute
-        contains a cache of examined if the document exists there, then it
-        goes unexamined. Non-python documents may be reexamined. Gedit may
-        change the document's mime-type, so it is important be able to
-        reexamine documents.
+        Python documents are only examined once. Gedit often emits several
+        identical adding, loading, and saving signals, so documents that
+        already carry the plugin's tags go unexamined. If the tab was moved
+        from another window, the document is handed over to this window
+        instead. Non-python documents may be reexamined. Gedit may change the
+        document's mime-type, so it is important be able to reexamine
+        documents.
         """
         #This occurs if the window is shut with a blank tab open
         if not tab or tab.get_state() != Gedit.TabState.STATE_NORMAL:
@@ -104,9 +234,16 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
         #Get the tab's underlying document
         doc = tab.get_document()
 
-        #Short circut for documents already examined
-        if doc in self.known_documents:
-            debug('Already know about the document, skipping')
+        #Short circut for documents already examined. The tags live exactly
+        #as long as the document, unlike its Python wrapper.
+        tag = doc.get_tag_table().lookup(MANAGED_TAG)
+        if tag is not None:
+            mdoc = MANAGED_DOCUMENTS.get(tag)
+            if mdoc is not None and mdoc.window is not window:
+                debug('Document moved from another window')
+                mdoc.move_to_window(window, self.pylint_daemon, doc)
+            else:
+                debug('Already know about the document, skipping')
             return False
 
         #Short circut for non-python files
@@ -116,10 +253,10 @@ class GeditPylint(GObject.Object, Gedit.WindowActivatable):
 
         debug("Adding Python Tab: ", tab)
 
-        mdoc = ManagedDocument(window, doc)
-
-        #Memorize the mdoc so it does not become garbage collected
-        self.known_documents[doc] = mdoc
+        #The document's signal handlers keep the mdoc alive for as long as
+        #the document itself lives.
+        mdoc = ManagedDocument(window, doc, self.pylint_daemon)
+        MANAGED_DOCUMENTS[doc.get_tag_table().lookup(MANAGED_TAG)] = mdoc
 
         #Give the python file an initial lint
         mdoc.run_pylint(doc, None)
@@ -149,264 +286,659 @@ class ManagedDocument:
     An object of this class should be instantiated whenever a python
     tab is added.
     """
-    def __init__(self, window, document):
+    def __init__(self, window, document, pylint_daemon):
         """This object needs to know about the Gedit window in order to
         alter its task bar. Also this object needs to know what document is
-        supposed to be managed.
+        supposed to be managed, and the PylintDaemon used to lint it.
+
+        The document is not stored, it is handed to every signal handler.
+        Holding on to it here would keep closed documents alive.
         """
         self.window = window
-        self.document = document
+        self.pylint_daemon = pylint_daemon
 
         #Get a handle to the status bar and create context id for this plugin
         self.status_bar = self.window.get_statusbar()
         self.context_id = self.status_bar.get_context_id('pylint')
 
-        #This will hold the messages retrieved by pylint.
-        #They will be indexed by tag object. This allows for easy
-        #access and lookup in the cursor-moved signal hanlder.
-        self.lint_messages = dict()
-
-        #These are the default colors used for the different pylint message
-        #types
-        self.lint_color = dict()
-        self.lint_color['F'] = Gdk.RGBA(1.0, 0.0, 0.0, 0.25)
-        self.lint_color['E'] = Gdk.RGBA(1.0, 0.5, 0.5, 0.25)
-        self.lint_color['W'] = Gdk.RGBA(1.0, 1.0, 0.5, 0.25)
-        self.lint_color['R'] = Gdk.RGBA(0.5, 1.0, 0.5, 0.25)
-        self.lint_color['C'] = Gdk.RGBA(0.5, 0.5, 1.0, 0.25)
-
-        #This is a catch all for any code *other* than the one listed.
-        #It is mostly used to signal an error condition inside the
-        #plugin. No one should ever see this color.
-        self.lint_color['O'] = Gdk.RGBA(0, 0, 0, 0.5)
-
-        #Pango does not seem to understand that "words" in code don't
-        #necessarily end with a period or whitespace. Instead they can
-        #contain underscore's or hyphens, etc. This list is used to perform
-        #a simple test to see if the we have selected a whole word or not.
-        self.word_end_exceptions = ['-', '_']
+        #This will hold the messages retrieved by pylint, in the order
+        #pylint reported them.
+        self.lint_messages = list()
+
+        #This holds a (start mark, end mark, tag, message) entry for each
+        #highlighted message, in document order. The marks move with the
+        #text as it is edited, so the cursor-moved signal hanlder can still
+        #find the message that was drawn under the cursor.
+        self.message_marks = list()
+
+        #The colors are shared by every managed document
+        self.lint_color = LINT_COLOR
+
+        #Each message type gets a single tag that is reused for every message
+        #of that type. The tag names follow the form 'pylint-X' where X is
+        #the message type.
+        self.category_tags = dict()
+        for msg_type, color in self.lint_color.items():
+            self.category_tags[msg_type] = document.create_tag(
+                'pylint-{}'.format(msg_type), background_rgba=color)
+
+        #Rapid saves would otherwise queue up several pylint runs. Only the
+        #results of the most recent request are used, and the request is
+        #delayed slightly so a burst of saves results in a single run.
+        self.active_request = None
+        self.lint_source_id = None
+
+        #Pylint's output for recently linted contents of this document,
+        #keyed by (filename, hash of the contents). Oldest entries are first.
+        #A save may go along with changes to other modules or to pylint's
+        #settings, so the cache is only trusted between saves.
+        self.result_cache = collections.OrderedDict()
 
         #At this point we know this tab contains a python file.
         #We need to run pylint when the document is saved,
         #and showing the lint messages in the status bar.
-        document.connect('saved', self.run_pylint)
+        document.connect('saved', self.document_saved)
         document.connect('cursor-moved', self.show_lint_message)
 
         debug('Init!!')
 
+    def move_to_window(self, window, pylint_daemon, document):
+        """This method is called when the document's tab is moved to another
+        window. That window's status bar and PylintDaemon are used from now
+        on, and the document is linted again so no request is left with the
+        old window's daemon.
+        """
+        self.status_bar.pop(self.context_id)
+
+        self.window = window
+        self.pylint_daemon = pylint_daemon
+        self.status_bar = self.window.get_statusbar()
+        self.context_id = self.status_bar.get_context_id('pylint')
+
+        self.run_pylint(document, None)
+
+    def document_saved(self, document, error=None, data=None):
+        """This method handles the document "saved" signal. The document is
+        always linted again, even if its contents are unchanged, since the
+        modules it imports may have been changed.
+        """
+        self.result_cache.clear()
+
+        return self.run_pylint(document, error)
+
     def run_pylint(self, document, error, data=None):
-        """This method runs pylint. In general this method is called as a
-        signal handler for the document "saved" signal.
+        """This method schedules a pylint run. In general this method is
+        called by document_saved(), but a run may also be requested when
+        the document is first examined.
 
-        Pylint is run in a subprocess. Its ouput is then parsed. Finally, the
-        document is highlighted based on the type of messages received from
-        pylint.
+        The run is debounced, if the document is saved again before
+        LINT_DELAY milliseconds have passed, the pending run is replaced.
+        """
+        #Cancel any pending run, the new one supersedes it
+        if self.lint_source_id is not None:
+            GLib.source_remove(self.lint_source_id)
+
+        self.lint_source_id = GLib.timeout_add(LINT_DELAY, self._spawn_pylint,
+                                               document)
+
+        return False
+
+    def _spawn_pylint(self, document):
+        """This method requests a pylint run. It is called from a GLib
+        timeout set up by run_pylint().
+
+        The document's text is handed to the shared PylintDaemon, so
+        unsaved documents can be linted too and the Gedit window stays
+        responsive while pylint works. When pylint finishes the
+        _on_pylint_done() method is called to handle its output.
         """
-        import os.path
-        import subprocess
-        import sys
+        #Returning False below removes the timeout source
+        self.lint_source_id = None
 
         debug('Running lint!')
 
         #Get the documents file name
-        filename = document.get_location().get_path()
-
-        #This may happen when a document is put in python mode
-        #but it has yet to be saved.
-        if filename is None:
+        location = document.get_location()
+        filename = location.get_path() if location is not None else None
+
+        if filename is not None:
+            #Pylint looks for settings files in several places,
+            #one of those places is along the path of the input file.
+            #Hence, we set the process' working directory to the file's
+            #directory.
+            working_directory = os.path.dirname(filename)
+        else:
+            #This may happen when a document is put in python mode
+            #but it has yet to be saved.
+            filename = UNSAVED_FILENAME
+            working_directory = os.path.expanduser('~')
+
+        text = document.get_text(document.get_start_iter(),
+                                 document.get_end_iter(), True)
+
+        #Gedit keeps the file's final newline out of the buffer, it is only
+        #added back when the file is written.
+        if document.get_implicit_trailing_newline():
+            text += '\n'
+
+        key = (filename, hashlib.blake2b(text.encode(),
+                                         digest_size=16).digest())
+
+        #Any earlier request that has not finished yet is now stale
+        self.active_request = None
+
+        #Unchanged contents do not need to be linted again
+        if key in self.result_cache:
+            debug('Reusing the previous lint results')
+            self.result_cache.move_to_end(key)
+            self.show_results(document, self.result_cache[key])
             return False
 
-        #Pylint looks for settings files in several places,
-        #one of those places is along the path of the input file.
-        #Hence, we set the process' working directory to the file's directory.
-        working_directory = os.path.dirname(filename)
+        #The similarities checker only finds duplicate code across several
+        #files, with a single file it is all cost and no messages.
+        self.active_request = object()
+        self.pylint_daemon.lint(working_directory,
+                                ['--from-stdin', filename, '-r', 'n',
+                                 '--output-format=json',
+                                 '--disable=similarities'],
+                                self._on_pylint_done,
+                                (document, self.active_request, key),
+                                source=text, owner=self)
 
-        #Run pylint
-        try:
-            proc = subprocess.Popen(['pylint', '-r', 'n',
-                                     '--msg-template={line}:{column}:'
-                                     '[{msg_id} {symbol}] {msg}',
-                                     filename],
-                                    cwd=working_directory,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT)
-            output, _ = proc.communicate()
-
-            #Pylint's exit codes do not follow the common convention.
-            #Any exit code less than 32 is not an error.
-            if proc.returncode >= 32:
-                debug('Pylint failed to run properly')
-                debug('Output from pylint:')
-                debug(str(output.decode()))
-                return False
-        except FileNotFoundError:
-            print('Pylint is not installed or not found on the path',
-                  file=sys.stderr)
+        return False
+
+    def _on_pylint_done(self, status, output, data):
+        """This method is called by the PylintDaemon once pylint has finished
+        the request made by _spawn_pylint(). Pylint's ouput is parsed and the
+        document is highlighted based on the type of messages received from
+        pylint.
 
+        Output for a request that has since been replaced by a newer one
+        is ignored.
+        """
+        document, request, key = data
+        if request is not self.active_request:
+            debug('Ignoring output from a stale pylint request')
+            return
+
+        self.active_request = None
+
+        #The daemon could not be run, it already reported why
+        if status is None:
+            return
+
+        #Pylint's exit codes do not follow the common convention.
+        #Any exit code less than 32 is not an error.
+        if status >= 32:
+            debug('Pylint failed to run properly')
+            debug('Output from pylint:')
+            debug(str(output))
+            return
+
+        self.result_cache[key] = output
+        if len(self.result_cache) > RESULT_CACHE_SIZE:
+            self.result_cache.popitem(last=False)
+
+        self.show_results(document, output)
+
+    def show_results(self, document, output):
+        """This method replaces the pylint highlighting in the document with
+        the messages found in pylint's output.
+        """
         #Empty the document of pylint tags
-        for tag in self.lint_messages.keys():
-            document.get_tag_table().remove(tag)
+        start, end = document.get_bounds()
+        for tag in self.category_tags.values():
+            document.remove_tag(tag, start, end)
 
         #Take pylints messages and parse them into tags and useful dicts.
-        self.lint_parse(document, output.decode())
+        self.lint_parse(document, output or '')
 
         #Apply the lint messages to the document
         self.apply_lint(document)
 
     def lint_parse(self, document, messages):
         """This function parses the output of pylint into a programatically
-        useful form. Pylint's messages are stored in a dictionary, which
-        is keyed to tags this function will create.
-
-        Pylint ouputs a header that will be discarded. Further, pylint
-        outputs lines showing where it thinks the error occured, these
-        are also discarded.
-
-        Each message will have a unique tag in the document. The tag names
-        follow the form 'pylint-#' (where # represents a number). Each tag
-        changes the background color of the window. The colors can be found
-        in self.lint_color dictionary. The tag's color is chosen based on
-        the message type.
-        """
-        import string
-
-        #Empty the messages dict
-        self.lint_messages.clear()
-
-        after_header = False
-        for n, message in enumerate(messages.split('\n')):
-            #Read off lint's header. Look for *, after that the real
-            #data begins
-            if not after_header:
-                if '*' == message[0] and '***' in message:
-                    after_header = True
-                continue
+        useful form. Pylint's messages are stored in a list, each one
+        along with the tag used to highlight it.
 
-            #Skip blank lines and lines begining with white space
-            if message is None or message is '' or \
-               message[0] in string.whitespace:
-                continue
+        Pylint is run with its JSON output format, so the messages arrive as
+        a list of objects that already have the line, column, and message
+        type broken out.
 
-            (line, column, status_txt) = message.split(':')
+        The tag is chosen from self.category_tags based on the message type.
+        Each tag changes the background color of the window. The colors can
+        be found in self.lint_color dictionary.
+        """
+        #Empty the messages list
+        self.lint_messages.clear()
 
-            #Look at the character after the bracket, it should be
-            #one of pylint's message types
-            if status_txt[1] in self.lint_color:
-                color = self.lint_color[status_txt[1]]
-            elif status_txt[1] == 'I':
+        try:
+            messages = json.loads(messages or '[]')
+            if not isinstance(messages, list):
+                raise ValueError('Expected a list of messages')
+        except ValueError:
+            debug('Could not parse the output from pylint:')
+            debug(messages)
+            return
+
+        for message in messages:
+            #The first letter of the type is pylint's message type
+            msg_type = message['type'][0].upper()
+
+            if msg_type in self.category_tags:
+                tag = self.category_tags[msg_type]
+            elif msg_type == 'I':
                 #This represents an ignore message. These are usually
                 #comments that tell pylint to not to ignore an issue in the
                 #file or on a line. We are goint to ignore them too.
                 continue
             else:
                 #We did not find a message type, use the error color
-                color = self.lint_color['O']
-
-            #Create a tag
-            tag = document.create_tag('pylint-{}'.format(n),
-                                      background_rgba=color)
+                tag = self.category_tags['O']
 
-            self.lint_messages[tag] = {'line': line, 'column': column,
-                                       'message': status_txt}
+            self.lint_messages.append({
+                'tag': tag,
+                'line': message['line'], 'column': message['column'],
+                'message': '[{} {}] {}'.format(message['message-id'],
+                                               message['symbol'],
+                                               message['message'])})
 
     def apply_lint(self, document):
         """This method applies the tags to the document that were previously
-        calculated. Essentially, each of the tags created in the lint_parse()
-        method, will be drawn onto to document.
+        calculated. Essentially, each of the messages found in the
+        lint_parse() method, will be drawn onto to document.
         """
-        for tag, status in self.lint_messages.items():
+        for start_mark, end_mark, _, _ in self.message_marks:
+            document.delete_mark(start_mark)
+            document.delete_mark(end_mark)
+        self.message_marks.clear()
+
+        #Messages are drawn in document order.
+        for status in sorted(self.lint_messages, key=message_position):
             #The document uses zero based line count
             line = int(status['line'])-1
             column = int(status['column'])
 
-            #The tag will be applied at the given line and column from pylint
-            start_iter = document.get_iter_at_line_offset(line, column)
+            #Lines past the end of the document are drawn on the last line.
+            line_start = document.get_iter_at_line(line)
+            line = line_start.get_line()
+            line_end = line_start.copy()
 
-            #We need to calculate where to end the tag. Start from the
-            #start postition.
-            #NOTE: The documentation says that we do not need to call the
-            #copy() method. I tried that, it did not work. This may be fixed
-            #in in an updated version of GTK's python bindings.
-            end_iter = start_iter.copy()
+            #On an empty line the iterator is already at the line end, moving
+            #it again would take it to the end of the next line.
+            if not line_end.ends_line():
+                line_end.forward_to_line_end()
+
+            #Python file's lines are usually indented, so the tag should
+            #start no earlier than the first non-whitespace character.
+            line_text = document.get_text(line_start, line_end, False)
+            indent = len(line_text) - len(line_text.lstrip())
+
+            #The tag will be applied at the line and column from pylint,
+            #but never past the end of the line's text.
+            start_column = min(max(column, indent), line_end.get_line_offset())
+            start_iter = document.get_iter_at_line_offset(line, start_column)
 
             #If the message is located at column zero, take that to mean
-            #that the message applies to the entire line.
-            if column == 0:
-                end_iter.forward_to_line_end()
+            #that the message applies to the entire line. Otherwise the
+            #tag ends with the first word found from the start position.
+            word = WORD_PATTERN.search(line_text, start_column)
+            if column == 0 or word is None:
+                end_iter = line_end
             else:
-                #Keep looking for the actual end of a word. The loop handles
-                #variable names like_this_one or strings-like-this.
-                while not end_iter.ends_line():
-                    end_iter.forward_word_end()
-                    if end_iter.get_char() not in self.word_end_exceptions:
-                        break
-
-            #Skip opening whitespace
-            forward_to_char(start_iter, end_iter)
+                end_iter = document.get_iter_at_line_offset(line, word.end())
 
             #Tag the text in the document
-            document.apply_tag(tag, start_iter, end_iter)
+            document.apply_tag(status['tag'], start_iter, end_iter)
+
+            #Remember where the message was drawn for show_lint_message().
+            #Like the tag, the marks do not grow over text typed at its ends.
+            self.message_marks.append(
+                (document.create_mark(None, start_iter, False),
+                 document.create_mark(None, end_iter, True),
+                 status['tag'], status['message']))
 
         return False
 
     def show_lint_message(self, doc, user_data=None):
         """This signal handler is called whenever the text cursor is moved.
-        It examines all the tags that apply to the cursor's position, looking
-        for any that were applied by this plugin. If it finds one of our
-        tags applies, it show the message in the status bar of Gedit.
+        It looks up the messages drawn on the cursor's line, and if one
+        covers the cursor and its tag is still there, it shows the message
+        in the status bar of Gedit.
 
         Honestly, StatusBar is the worst implementation of a stack ever. Try
         not to mess with this too much, it works.
         """
-        cursor_pos = doc.get_property('cursor-position')
+        #Remove any previous pylint message. Should be harmless, if
+        #the status bar was not showing a pylint message.
+        self.status_bar.pop(self.context_id)
 
-        #Examine all tags that are at the cursor position
-        for tag in doc.get_iter_at_offset(cursor_pos).get_tags():
-            #Look for tags that have 'pylint' in their name
-            name = tag.get_property('name')
-            if name is not None and 'pylint' in name:
-                #Get the text this tag was created to represent
-                msg = self.lint_messages[tag]['message']
+        cursor_pos = doc.get_property('cursor-position')
+        cursor_iter = doc.get_iter_at_offset(cursor_pos)
 
-                #Remove any previous pylint message
-                self.status_bar.pop(self.context_id)
+        #Most of the time the cursor is not on a highlight at all
+        tags = self.category_tags.values()
+        if not any(tag in tags for tag in cursor_iter.get_tags()):
+            return False
 
-                #Show the message in the status bar
-                self.status_bar.push(self.context_id, msg)
-                return False
+        cursor_line = cursor_iter.get_line()
 
-        #If we get here then the cursor is not in a pylint tag. We need to
-        #now clear the status bar of our message. Should be harmless, if
-        #the status bar was not showing a pylint message.
-        self.status_bar.pop(self.context_id)
+        #Edits never reorder the marks, so the last message starting at or
+        #before the cursor is found with a binary search.
+        low, high = 0, len(self.message_marks)
+        while low < high:
+            middle = (low + high) // 2
+            start_mark = self.message_marks[middle][0]
+            if doc.get_iter_at_mark(start_mark).get_offset() <= cursor_pos:
+                low = middle + 1
+            else:
+                high = middle
+
+        #Messages are drawn within a line, so only the ones starting on the
+        #cursor's line can cover it. The first one drawn wins.
+        msg = None
+        for index in range(low - 1, -1, -1):
+            start_mark, end_mark, tag, message = self.message_marks[index]
+            start_iter = doc.get_iter_at_mark(start_mark)
+            if start_iter.get_line() != cursor_line:
+                break
+
+            #Like the tag, the range excludes its end. The tag is gone if the
+            #text it covered has been edited away.
+            end_iter = doc.get_iter_at_mark(end_mark)
+            if cursor_pos < end_iter.get_offset() and \
+                    cursor_iter.has_tag(tag):
+                msg = message
+
+        #Show the message in the status bar
+        if msg is not None:
+            self.status_bar.push(self.context_id, msg)
 
         return False
 
 
-def forward_to_char(start_iter, limit_iter):
-    """Since python file's lines are usually indented, we need to move
-    the start position to the first non-whitespace character. We limit
-    how far the iterator can go using the second parameter (usually set
-    to the end of the line).
+class PylintDaemon:
+    """This class manages a long lived python process that has pylint
+    imported. Files are sent to the process to be linted, which saves paying
+    pylint's considerable startup time on every save.
 
-    Note: This function essentially replicates the functionality of the
-    Gtk.TextIter.forward_find_char() method. I actually tried to use this
-    but I got un-google-able errors about converting gunichar. This
-    might be fixed in the future, in which case this function can
-    be replaced with a lambda.
+    Requests are handled one at a time, in the order they were made. If the
+    process dies, or takes longer than LINT_TIMEOUT seconds to respond, it is
+    restarted for the next request. If pylint cannot be imported at all the
+    daemon gives up, until the plugin is reloaded.
     """
-    import string
+    def __init__(self):
+        self.proc = None
+        self.responses = None
+
+        #True once the process has imported pylint and can take requests
+        self.ready = False
+
+        #True once pylint turned out not to be installed
+        self.unavailable = False
+
+        #Requests waiting to be handled, the first one is in progress. Each
+        #one is a (request, callback, data, owner, token) tuple.
+        self.queue = collections.deque()
+
+        #The GLib source that kills a daemon stuck on a request
+        self.timeout_id = None
+
+    def start(self):
+        """Start the pylint process if it is not already running. Returns
+        True if the process is running.
+        """
+        if self.proc is not None:
+            return True
+
+        if self.unavailable:
+            return False
 
-    while (start_iter.get_char() in string.whitespace and
-           start_iter.get_offset() < limit_iter.get_offset()):
-        start_iter.forward_char()
+        debug('Starting the pylint daemon')
+        launcher = Gio.SubprocessLauncher.new(Gio.SubprocessFlags.STDIN_PIPE |
+                                              Gio.SubprocessFlags.STDOUT_PIPE)
 
+        #glibc's MALLOC_PERTURB_ is often set in GNOME development setups,
+        #it noticeably slows pylint down.
+        launcher.unsetenv('MALLOC_PERTURB_')
 
-def debug(*msg):
-    """This function prints out debug messages when ENABLE_DEBUG is True.
-    It is useful for tracking down errors caused by the plugin.
+        python = pylint_python()
+        try:
+            self.proc = launcher.spawnv(python + ['-c', DAEMON_SCRIPT])
+        except GLib.Error:
+            print('Could not run {} to start pylint'.format(python[0]),
+                  file=sys.stderr)
+            return False
+
+        #Requests are held back until pylint has been imported
+        self.ready = False
+        self.responses = Gio.DataInputStream.new(self.proc.get_stdout_pipe())
+        self.responses.read_line_async(GLib.PRIORITY_DEFAULT, None,
+                                       self._on_ready, self.responses)
+        return True
+
+    def _on_ready(self, stream, result, responses):
+        """The process has either imported pylint and is ready for the
+        first request, or it exited because pylint could not be imported.
+        """
+        line = None
+        try:
+            line, _ = stream.read_line_finish_utf8(result)
+        except GLib.Error as err:
+            debug('Could not read output from pylint: ', err.message)
+
+        #The process was stopped or replaced while this read was pending
+        if responses is not self.responses:
+            return
+
+        if line == 'ready':
+            self.ready = True
+            self._send()
+            return
+
+        #Restarting would fail the same way, so stop trying
+        print('Pylint is not installed or not found on the path',
+              file=sys.stderr)
+        self.unavailable = True
+        self.proc.force_exit()
+        self.proc = None
+        self.responses = None
+
+        while self.queue:
+            _, callback, data, _, _ = self.queue.popleft()
+            callback(None, None, data)
+
+    def stop(self):
+        """Kill the pylint process. Any pending requests are dropped."""
+        self.queue.clear()
+        self._cancel_timeout()
+        if self.proc is not None:
+            debug('Stopping the pylint daemon')
+            self.proc.force_exit()
+            self.proc = None
+            self.responses = None
+            self.ready = False
+
+    def lint(self, cwd, args, callback, data=None, source='', owner=None):
+        """Queue a pylint run inside cwd using the given command line
+        arguments. The source is what pylint will read for --from-stdin.
+        When the run finishes callback(status, output, data) is called,
+        status is None if pylint could not be run at all.
+
+        The owner, if given, is an object with an active_request attribute.
+        The request is dropped without being run if the owner's
+        active_request changes before pylint gets to it, and it replaces
+        any of the owner's requests that are still waiting.
+        """
+        request = json.dumps({'cwd': cwd, 'args': args,
+                              'source': source}) + '\n'
+        token = getattr(owner, 'active_request', None)
+
+        #The first request has already been sent, the owner's requests
+        #waiting behind it are superseded by this one.
+        if owner is not None and len(self.queue) > 1:
+            in_progress = self.queue.popleft()
+            self.queue = collections.deque(
+                item for item in self.queue if item[3] is not owner)
+            self.queue.appendleft(in_progress)
+
+        self.queue.append((request, callback, data, owner, token))
+
+        #Nothing was in progress, so handle this request right away
+        if len(self.queue) == 1:
+            self._send()
+
+    def _send(self):
+        """Write the request at the front of the queue to the process."""
+        #Requests whose owner has moved on would only be ignored
+        while self.queue and self.queue[0][3] is not None and \
+                self.queue[0][3].active_request is not self.queue[0][4]:
+            debug('Dropping a stale pylint request')
+            self.queue.popleft()
+
+        if not self.queue:
+            return
+
+        if not self.start():
+            _, callback, data, _, _ = self.queue.popleft()
+            callback(None, None, data)
+            self._send()
+            return
+
+        #_on_ready() sends the request once pylint has been imported
+        if not self.ready:
+            return
+
+        request = self.queue[0][0].encode()
+        self.proc.get_stdin_pipe().write_all_async(request,
+                                                   GLib.PRIORITY_DEFAULT,
+                                                   None, self._on_sent,
+                                                   self.responses)
+        self.timeout_id = GLib.timeout_add_seconds(LINT_TIMEOUT,
+                                                   self._on_timeout)
+
+    def _on_timeout(self):
+        """Pylint took too long. Killing the process ends the pending read,
+        so _on_response() fails the request and a new process is started for
+        the next one.
+        """
+        self.timeout_id = None
+        debug('Pylint did not respond in time, killing the daemon')
+        self.proc.force_exit()
+
+        return False
+
+    def _cancel_timeout(self):
+        """Remove the timeout set up for the request in progress."""
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def _on_sent(self, stream, result, responses):
+        """The request was written, wait for pylint's response."""
+        try:
+            stream.write_all_finish(result)
+        except GLib.Error as err:
+            debug('Could not send request to pylint: ', err.message)
+            self._on_response(responses, None, responses)
+            return
+
+        #The process was stopped or replaced while the request was written
+        if responses is not self.responses:
+            return
+
+        responses.read_line_async(GLib.PRIORITY_DEFAULT, None,
+                                  self._on_response, responses)
+
+    def _on_response(self, stream, result, responses):
+        """Hand pylint's response to the caller and move on to the next
+        request in the queue.
+
+        Callbacks are tied to the responses stream of the process that was
+        sent the request, those from a process that has since been stopped
+        or replaced are ignored.
+        """
+        line = None
+        if result is not None:
+            try:
+                line, _ = stream.read_line_finish_utf8(result)
+            except GLib.Error as err:
+                debug('Could not read output from pylint: ', err.message)
+
+        if responses is not self.responses:
+            return
+
+        self._cancel_timeout()
+
+        #The queue is emptied when the daemon is stopped
+        if not self.queue:
+            return
+
+        _, callback, data, _, _ = self.queue.popleft()
+
+        response = None
+        if line is not None:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                debug('Could not parse the response from pylint:')
+                debug(line)
+
+        if response is None:
+            #The process died or is confused, it will be restarted
+            #for the next request
+            debug('The pylint daemon exited unexpectedly')
+            if not self.proc.get_if_exited():
+                self.proc.force_exit()
+            self.proc = None
+            self.responses = None
+
+        #The next request must be sent even if the callback fails,
+        #otherwise every later request would wait forever.
+        try:
+            if response is None:
+                callback(None, None, data)
+            else:
+                callback(response['status'], response['output'], data)
+        finally:
+            self._send()
+
+
+def pylint_python():
+    """Return the command line that runs the python interpreter pylint is
+    installed for, taken from the #! line of the pylint script.
     """
-    import sys
+    path = GLib.find_program_in_path(PYLINT_SCRIPT)
+    if path is not None:
+        try:
+            with open(path, 'rb') as script:
+                first_line = script.readline()
+        except OSError:
+            first_line = b''
+
+        #Distributions may install pylint as a shell script wrapper
+        if first_line.startswith(b'#!'):
+            command = first_line[2:].decode(errors='replace').split()
+            if any(os.path.basename(part).startswith('python')
+                   for part in command):
+                return command
 
-    if ENABLE_DEBUG:
+    return [PYLINT_PYTHON]
+
+
+def message_position(status):
+    """Sort key that orders lint messages by their line and column."""
+    return (int(status['line']), int(status['column']))
+
+
+#The choice is made once, when the plugin is loaded, so a disabled debug()
+#does not even test ENABLE_DEBUG when it is called.
+if ENABLE_DEBUG:
+    def debug(*msg):
+        """This function prints out debug messages when ENABLE_DEBUG is True.
+        It is useful for tracking down errors caused by the plugin.
+        """
         print('PYLINT: ', *msg, file=sys.stderr)
+else:
+    def debug(*msg):
+        """Debug messages are turned off, see ENABLE_DEBUG."""